@@ -1,14 +1,18 @@
-import contextlib
+import collections
+import concurrent.futures
+import functools
 import hashlib
-import json
 import logging
 import sys
 import time
 import threading
 
-from ecdsa import NIST256p
-from ecdsa import VerifyingKey
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import utils as ec_utils
 import requests
+from requests.adapters import HTTPAdapter
 
 import utils
 
@@ -20,28 +24,47 @@ MINING_TIMER_SEC = 20
 BLOCKCHAIN_PORT_RANGE = (5000, 5003)
 NEIGHBOURS_IP_RANGE_NUM = (0, 1)
 BLOCKCHAIN_NEIGHBOURS_SYNC_TIME_SEC = 20
+BLOCKCHAIN_NEIGHBOURS_TIMEOUT_SEC = 3
+BLOCKCHAIN_NEIGHBOURS_POOL_SIZE = 16
 
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=4096)
+def _load_verifying_key(sender_public_key):
+    return ec.EllipticCurvePublicKey.from_encoded_point(
+        ec.SECP256R1(), b'\x04' + bytes.fromhex(sender_public_key))
+
+
 class BlockChain(object):
 
     def __init__(self, blockchain_address=None, port=None):
         self.transaction_pool = []
         self.chain = []
+        self.balances = collections.defaultdict(float)
         self.neighbours = []
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(
+            pool_connections=BLOCKCHAIN_NEIGHBOURS_POOL_SIZE,
+            pool_maxsize=BLOCKCHAIN_NEIGHBOURS_POOL_SIZE,
+            max_retries=0))
         self.create_block(0, self.hash({}))
         self.blockchain_address = blockchain_address
         self.port = port
-        self.mining_semaphore = threading.Semaphore(1)
-        self.sync_neighbours_semaphore = threading.Semaphore(1)
+        self.stop_event = threading.Event()
+        self.loops_lock = threading.Lock()
+        self.mining_thread = None
+        self.sync_neighbours_thread = None
 
     def run(self):
         self.sync_neighbours()
         self.resolve_conflicts()
         self.start_mining()
 
+    def stop(self):
+        self.stop_event.set()
+
     def set_neighbours(self):
         self.neighbours = utils.find_neighbours(
             utils.get_host(), self.port,
@@ -52,56 +75,95 @@ class BlockChain(object):
         })
 
     def sync_neighbours(self):
-        is_acquire = self.sync_neighbours_semaphore.acquire(blocking=False)
-        if is_acquire:
-            with contextlib.ExitStack() as stack:
-                stack.callback(self.sync_neighbours_semaphore.release)
+        self.set_neighbours()
+        with self.loops_lock:
+            if (self.sync_neighbours_thread is None or
+                    not self.sync_neighbours_thread.is_alive()):
+                self.sync_neighbours_thread = threading.Thread(
+                    target=self.sync_neighbours_loop, daemon=True)
+                self.sync_neighbours_thread.start()
+
+    def sync_neighbours_loop(self):
+        while not self.stop_event.wait(BLOCKCHAIN_NEIGHBOURS_SYNC_TIME_SEC):
+            try:
                 self.set_neighbours()
-                loop = threading.Timer(
-                    BLOCKCHAIN_NEIGHBOURS_SYNC_TIME_SEC, self.sync_neighbours)
-                loop.start()
+            except Exception as ex:
+                logger.error({'action': 'sync_neighbours_loop', 'ex': ex})
+
+    def request_neighbour(self, method, node, path, **kwargs):
+        try:
+            return self.session.request(
+                method, f'http://{node}{path}',
+                timeout=BLOCKCHAIN_NEIGHBOURS_TIMEOUT_SEC, **kwargs)
+        except requests.RequestException as ex:
+            logger.error({
+                'action': 'request_neighbour',
+                'method': method,
+                'node': node,
+                'path': path,
+                'ex': ex
+            })
+            return None
+
+    def broadcast(self, method, path, **kwargs):
+        neighbours = self.neighbours
+        if not neighbours:
+            return
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(neighbours)) as executor:
+            for node in neighbours:
+                executor.submit(
+                    self.request_neighbour, method, node, path, **kwargs)
 
     def create_block(self, nonce, previous_hash):
-        block = utils.sorted_dict_by_key({
-            'timestamp': time.time(),
-            'transactions': self.transaction_pool,
+        transactions, self.transaction_pool = self.transaction_pool, []
+        block = {
             'nonce': nonce,
-            'previous_hash': previous_hash
-        })
+            'previous_hash': previous_hash,
+            'timestamp': time.time(),
+            'transactions': transactions
+        }
+        block_hash = self.hash(block)
+        balance_changes = self.balance_changes(transactions)
         self.chain.append(block)
-        self.transaction_pool = []
+        self.last_block_hash = block_hash
+        self.update_balances(balance_changes)
 
-        for node in self.neighbours:
-            requests.delete(f'http://{node}/transactions')
+        self.broadcast('DELETE', '/transactions')
 
         return block
 
     def hash(self, block):
-        sorted_block = json.dumps(block, sort_keys=True)
-        return hashlib.sha256(sorted_block.encode()).hexdigest()
+        sorted_block = utils.canonical_json(block)
+        return hashlib.sha256(sorted_block).hexdigest()
 
     def add_transaction(self, sender_blockchain_address,
                         recipient_blockchain_address, value,
                         sender_public_key=None, signature=None):
-        transaction = utils.sorted_dict_by_key({
-            'sender_blockchain_address': sender_blockchain_address,
+        transaction = {
             'recipient_blockchain_address': recipient_blockchain_address,
+            'sender_blockchain_address': sender_blockchain_address,
             'value': float(value)
-        })
+        }
+
+        if not self.valid_transaction(transaction):
+            logger.error({
+                'action': 'add_transaction', 'error': 'invalid_transaction'
+            })
+            return False
 
         if sender_blockchain_address == MINING_SENDER:
             self.transaction_pool.append(transaction)
             return True
 
+        if (self.calculate_total_amount(sender_blockchain_address)
+                < float(value)):
+            logger.error(
+                    {'action': 'add_transaction', 'error': 'no_value'})
+            return False
+
         if self.verify_transaction_signature(
                 sender_public_key, signature, transaction):
-
-            if (self.calculate_total_amount(sender_blockchain_address)
-                    < float(value)):
-                logger.error(
-                        {'action': 'add_transaction', 'error': 'no_value'})
-                return False
-
             self.transaction_pool.append(transaction)
             return True
         return False
@@ -115,48 +177,52 @@ class BlockChain(object):
             value, sender_public_key, signature)
 
         if is_transacted:
-            for node in self.neighbours:
-                requests.put(
-                    f'http://{node}/transactions',
-                    json={
-                        'sender_blockchain_address': sender_blockchain_address,
-                        'recipient_blockchain_address':
-                            recipient_blockchain_address,
-                        'value': value,
-                        'sender_public_key': sender_public_key,
-                        'signature': signature,
-                    }
-                )
+            self.broadcast(
+                'PUT', '/transactions',
+                json={
+                    'sender_blockchain_address': sender_blockchain_address,
+                    'recipient_blockchain_address':
+                        recipient_blockchain_address,
+                    'value': value,
+                    'sender_public_key': sender_public_key,
+                    'signature': signature,
+                }
+            )
         return is_transacted
 
     def verify_transaction_signature(
             self, sender_public_key, signature, transaction):
         sha256 = hashlib.sha256()
-        sha256.update(str(transaction).encode('utf-8'))
+        sha256.update(utils.canonical_json(transaction))
         message = sha256.digest()
-        signature_bytes = bytes().fromhex(signature)
-        verifying_key = VerifyingKey.from_string(
-            bytes().fromhex(sender_public_key), curve=NIST256p)
-        verified_key = verifying_key.verify(signature_bytes, message)
-        return verified_key
+        signature_bytes = bytes.fromhex(signature)
+        der_signature = ec_utils.encode_dss_signature(
+            int.from_bytes(signature_bytes[:32], 'big'),
+            int.from_bytes(signature_bytes[32:], 'big'))
+        verifying_key = _load_verifying_key(sender_public_key)
+        try:
+            verifying_key.verify(
+                der_signature, message,
+                ec.ECDSA(ec_utils.Prehashed(hashes.SHA256())))
+        except InvalidSignature:
+            return False
+        return True
+
+    def transactions_bytes(self, transactions):
+        return utils.canonical_json(transactions)
 
     def valid_proof(self, transactions, previous_hash, nonce,
                     difficulty=MINING_DIFFICULTY):
-        guess_block = utils.sorted_dict_by_key({
-            'transactions': transactions,
-            'nonce': nonce,
-            'previous_hash': previous_hash
-        })
-        guess_hash = self.hash(guess_block)
-        return guess_hash[:difficulty] == '0'*difficulty
+        guess_block = utils.canonical_block_bytes(
+            self.transactions_bytes(transactions), nonce, previous_hash)
+        guess_hash = hashlib.sha256(guess_block).digest()
+        return utils.make_proof_checker(difficulty)(guess_hash)
 
     def proof_of_work(self):
         transactions = self.transaction_pool.copy()
-        previous_hash = self.hash(self.chain[-1])
-        nonce = 0
-        while self.valid_proof(transactions, previous_hash, nonce) is False:
-            nonce += 1
-        return nonce
+        prefix, suffix = utils.canonical_block_parts(
+            self.transactions_bytes(transactions), self.last_block_hash)
+        return utils.find_nonce(prefix, suffix, MINING_DIFFICULTY)
 
     def mining(self):
         # if not self.transaction_pool:
@@ -167,38 +233,60 @@ class BlockChain(object):
             recipient_blockchain_address=self.blockchain_address,
             value=MINING_REWARD)
         nonce = self.proof_of_work()
-        previous_hash = self.hash(self.chain[-1])
-        self.create_block(nonce, previous_hash)
+        self.create_block(nonce, self.last_block_hash)
         logger.info({'action': 'mining', 'status': 'success'})
 
-        for node in self.neighbours:
-            requests.put(f'http://{node}/consensus')
+        self.broadcast('PUT', '/consensus')
 
         return True
 
     def start_mining(self):
-        is_acquire = self.mining_semaphore.acquire(blocking=False)
-        if is_acquire:
-            with contextlib.ExitStack() as stack:
-                stack.callback(self.mining_semaphore.release)
+        with self.loops_lock:
+            if (self.mining_thread is None or
+                    not self.mining_thread.is_alive()):
+                self.mining_thread = threading.Thread(
+                    target=self.mining_loop, daemon=True)
+                self.mining_thread.start()
+
+    def mining_loop(self):
+        while not self.stop_event.is_set():
+            try:
                 self.mining()
-                loop = threading.Timer(MINING_TIMER_SEC, self.start_mining)
-                loop.start()
+            except Exception as ex:
+                logger.error({'action': 'mining_loop', 'ex': ex})
+            self.stop_event.wait(MINING_TIMER_SEC)
+
+    def valid_transaction(self, transaction):
+        if not isinstance(transaction, dict):
+            return False
+        sender = transaction.get('sender_blockchain_address')
+        recipient = transaction.get('recipient_blockchain_address')
+        value = transaction.get('value')
+        return (isinstance(sender, str) and isinstance(recipient, str) and
+                isinstance(value, (int, float)) and
+                not isinstance(value, bool))
+
+    def balance_changes(self, transactions):
+        changes = collections.defaultdict(float)
+        for transaction in transactions:
+            value = float(transaction['value'])
+            changes[transaction['recipient_blockchain_address']] += value
+            changes[transaction['sender_blockchain_address']] -= value
+        return changes
+
+    def update_balances(self, balance_changes):
+        for blockchain_address, change in balance_changes.items():
+            self.balances[blockchain_address] += change
 
     def calculate_total_amount(self, blockchain_address):
-        total_amount = 0.0
-        for block in self.chain:
-            for transaction in block['transactions']:
-                value = float(transaction['value'])
-                if blockchain_address == \
-                        transaction['recipient_blockchain_address']:
-                    total_amount += value
-                if blockchain_address == \
-                        transaction['sender_blockchain_address']:
-                    total_amount -= value
-        return total_amount
+        return self.balances.get(blockchain_address, 0.0)
 
     def valid_chain(self, chain):
+        for block in chain:
+            if not all(self.valid_transaction(transaction)
+                       for transaction in block['transactions']):
+                return False
+
         pre_block = chain[0]
         current_index = 1
         while current_index < len(chain):
@@ -219,8 +307,8 @@ class BlockChain(object):
         longest_chain = None
         max_length = len(self.chain)
         for node in self.neighbours:
-            response = requests.get(f'http://{node}/chain')
-            if response.status_code == 200:
+            response = self.request_neighbour('GET', node, '/chain')
+            if response is not None and response.status_code == 200:
                 response_json = response.json()
                 chain = response_json['chain']
                 chain_length = len(chain)
@@ -229,7 +317,14 @@ class BlockChain(object):
                     longest_chain = chain
 
         if longest_chain:
+            balances = collections.defaultdict(float)
+            for block in longest_chain:
+                for blockchain_address, change in self.balance_changes(
+                        block['transactions']).items():
+                    balances[blockchain_address] += change
             self.chain = longest_chain
+            self.last_block_hash = self.hash(longest_chain[-1])
+            self.balances = balances
             logger.info({'action': 'resolve_conflicts', 'status': 'replaced'})
             return True
 
@@ -1,12 +1,16 @@
 from flask import Flask
 from flask import jsonify
 from flask import request
+from flask import Response
 
 import blockchain
+import json_provider
+import utils
 import wallet
 
 
 app = Flask(__name__)
+app.json = json_provider.OrjsonProvider(app)
 cache = {}
 
 
@@ -26,11 +30,17 @@ def get_blockchain():
 
 @app.route('/chain', methods=['GET'])
 def get_chain():
-    block_chain = get_blockchain()
-    response = {
-        'chain': block_chain.chain
-    }
-    return jsonify(response), 200
+    chain = get_blockchain().chain
+
+    def generate():
+        yield b'{"chain":['
+        separator = b''
+        for block in chain:
+            yield separator + utils.canonical_json(block)
+            separator = b','
+        yield b']}'
+
+    return Response(generate(), mimetype='application/json'), 200
 
 
 @app.route('/transactions', methods=['GET', 'POST', 'PUT', 'DELETE'])
@@ -0,0 +1,8 @@
+import os
+
+from blockchain_server import app
+from blockchain_server import get_blockchain
+
+app.config['port'] = int(os.environ.get('BLOCKCHAIN_PORT', 5000))
+
+get_blockchain().run()
@@ -0,0 +1,13 @@
+from flask.json.provider import JSONProvider
+import orjson
+
+import utils
+
+
+class OrjsonProvider(JSONProvider):
+
+    def dumps(self, obj, **kwargs):
+        return utils.canonical_json(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
@@ -1,18 +1,62 @@
-import collections
+import concurrent.futures
+import functools
+import hashlib
 import logging
-import re
 import socket
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
-RE_IP = re.compile(
-    '(?P<prefix_host>^\\d{1,3}\\.\\d{1,3}\\.\\d{1,3}\\.)'
-    '(?P<last_ip>\\d{1,3}$)')
+
+def canonical_json(obj):
+    return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+
+
+def canonical_block_parts(transactions_bytes, previous_hash):
+    # Same bytes as canonical_json(guess_block) with the nonce digits
+    # left out; "nonce" sorts first so they go in between.
+    return b'{"nonce":', b''.join((
+        b',"previous_hash":"', previous_hash.encode(),
+        b'","transactions":', transactions_bytes, b'}'))
+
+
+def canonical_block_bytes(transactions_bytes, nonce, previous_hash):
+    prefix, suffix = canonical_block_parts(transactions_bytes, previous_hash)
+    return prefix + str(nonce).encode() + suffix
 
 
-def sorted_dict_by_key(unsorted_dict):
-    return collections.OrderedDict(
-        sorted(unsorted_dict.items(), key=lambda d: d[0]))
+@functools.lru_cache(maxsize=None)
+def make_proof_checker(difficulty):
+    # Same test as hexdigest()[:difficulty] == '0'*difficulty, specialized
+    # once per difficulty: whole zero bytes are a prefix match and an odd
+    # trailing zero nibble is a single comparison.
+    zero_bytes = bytes(difficulty // 2)
+    if difficulty % 2 == 0:
+        def check(digest):
+            return digest.startswith(zero_bytes)
+        return check
+
+    nibble_index = difficulty // 2
+
+    def check(digest):
+        return digest.startswith(zero_bytes) and digest[nibble_index] < 0x10
+    return check
+
+
+def find_nonce(prefix, suffix, difficulty):
+    # The prefix is hashed once; each guess resumes from a copy of that
+    # state, so only the nonce digits and the suffix go through SHA-256.
+    is_valid = make_proof_checker(difficulty)
+    prefix_state = hashlib.sha256(prefix)
+    nonce = 0
+    while True:
+        sha256 = prefix_state.copy()
+        sha256.update(str(nonce).encode())
+        sha256.update(suffix)
+        if is_valid(sha256.digest()):
+            return nonce
+        nonce += 1
 
 
 def pprint(chains):
@@ -50,20 +94,27 @@ def find_neighbours(
         my_host, my_port, start_ip_range, end_ip_range, start_port, end_port):
     # 192.168.0.24 (1,3)
     address = f'{my_host}:{my_port}'
-    m = RE_IP.search(my_host)
-    if not m:
+    try:
+        prefix_host, last_ip = my_host.rsplit('.', 1)
+        last_ip = int(last_ip)
+    except ValueError:
         return None
 
-    prefix_host = m.group('prefix_host')
-    last_ip = m.group('last_ip')
+    candidates = [
+        (f'{prefix_host}.{last_ip+int(ip_range)}', guess_port)
+        for guess_port in range(start_port, end_port)
+        for ip_range in range(start_ip_range, end_ip_range)]
+    if not candidates:
+        return []
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(32, len(candidates))) as executor:
+        found = executor.map(lambda c: is_found_host(*c), candidates)
 
-    neighbours = []
-    for guess_port in range(start_port, end_port):
-        for ip_range in range(start_ip_range, end_ip_range):
-            guess_host = f'{prefix_host}{int(last_ip)+int(ip_range)}'
+        neighbours = []
+        for (guess_host, guess_port), is_found in zip(candidates, found):
             guess_address = f'{guess_host}:{guess_port}'
-            if (is_found_host(guess_host, guess_port) and
-                    not guess_address == address):
+            if is_found and not guess_address == address:
                 neighbours.append(guess_address)
     return neighbours
 
@@ -1,9 +1,11 @@
 import base58
-import codecs
 import hashlib
 
-from ecdsa import NIST256p
-from ecdsa import SigningKey
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import utils as ec_utils
 
 import utils
 
@@ -11,48 +13,45 @@ import utils
 class Wallet(object):
 
     def __init__(self):
-        self._private_key = SigningKey.generate(curve=NIST256p)
-        self._public_key = self._private_key.get_verifying_key()
+        self._private_key = ec.generate_private_key(
+            ec.SECP256R1(), default_backend())
+        self._public_key = self._private_key.public_key()
         self._blockchain_address = self.generate_blockchain_address()
 
     @property
     def private_key(self):
-        return self._private_key.to_string().hex()
+        private_value = self._private_key.private_numbers().private_value
+        return private_value.to_bytes(32, 'big').hex()
 
     @property
     def public_key(self):
-        return self._public_key.to_string().hex()
+        return self.public_key_bytes().hex()
 
     @property
     def blockchain_address(self):
         return self._blockchain_address
 
-    def generate_blockchain_address(self):
-        public_key_bytes = self._public_key.to_string()
-        sha256_bpk = hashlib.sha256(public_key_bytes)
-        sha256_bpk_digest = sha256_bpk.digest()
-
-        ripemed160_bpk = hashlib.new('ripemd160')
-        ripemed160_bpk.update(sha256_bpk_digest)
-        ripemed160_bpk_digest = ripemed160_bpk.digest()
-        ripemed160_bpk_hex = codecs.encode(ripemed160_bpk_digest, 'hex')
-
-        network_byte = b'00'
-        network_bitcoin_public_key = network_byte + ripemed160_bpk_hex
-        network_bitcoin_public_key_bytes = codecs.decode(
-            network_bitcoin_public_key, 'hex')
+    def public_key_bytes(self):
+        # Raw X || Y coordinates, without the 0x04 uncompressed marker
+        return self._public_key.public_bytes(
+            serialization.Encoding.X962,
+            serialization.PublicFormat.UncompressedPoint)[1:]
 
-        sha256_bpk = hashlib.sha256(network_bitcoin_public_key_bytes)
-        sha256_bpk_digest = sha256_bpk.digest()
-        sha256_2_nbpk = hashlib.sha256(sha256_bpk_digest)
-        sha256_2_nbpk_digest = sha256_2_nbpk.digest()
-        sha256_hex = codecs.encode(sha256_2_nbpk_digest, 'hex')
+    def generate_blockchain_address(self):
+        public_key_bytes = self.public_key_bytes()
+        sha256_bpk_digest = hashlib.sha256(public_key_bytes).digest()
+        ripemed160_bpk_digest = hashlib.new(
+            'ripemd160', sha256_bpk_digest).digest()
 
-        checksum = sha256_hex[:8]
+        network_byte = b'\x00'
+        network_bitcoin_public_key = network_byte + ripemed160_bpk_digest
 
-        address_hex = (network_bitcoin_public_key + checksum).decode('utf-8')
+        sha256_bpk_digest = hashlib.sha256(network_bitcoin_public_key).digest()
+        sha256_2_nbpk_digest = hashlib.sha256(sha256_bpk_digest).digest()
+        checksum = sha256_2_nbpk_digest[:4]
 
-        blockchain_address = base58.b58encode(address_hex).decode('utf-8')
+        blockchain_address = base58.b58encode(
+            network_bitcoin_public_key + checksum).decode('utf-8')
         return blockchain_address
 
 
@@ -69,15 +68,18 @@ class Transaction(object):
 
     def generate_signature(self):
         sha256 = hashlib.sha256()
-        transaction = utils.sorted_dict_by_key({
-            'sender_blockchain_address': self.sender_blockchain_address,
+        transaction = {
             'recipient_blockchain_address': self.recipient_blockchain_address,
+            'sender_blockchain_address': self.sender_blockchain_address,
             'value': float(self.value)
-        })
-        sha256.update(str(transaction).encode('utf-8'))
+        }
+        sha256.update(utils.canonical_json(transaction))
         message = sha256.digest()
-        private_key = SigningKey.from_string(
-            bytes().fromhex(self.sender_private_key), curve=NIST256p)
-        private_key_sign = private_key.sign(message)
-        signature = private_key_sign.hex()
+        private_key = ec.derive_private_key(
+            int(self.sender_private_key, 16), ec.SECP256R1(),
+            default_backend())
+        private_key_sign = private_key.sign(
+            message, ec.ECDSA(ec_utils.Prehashed(hashes.SHA256())))
+        r, s = ec_utils.decode_dss_signature(private_key_sign)
+        signature = (r.to_bytes(32, 'big') + s.to_bytes(32, 'big')).hex()
         return signature
@@ -6,9 +6,11 @@ from flask import render_template
 from flask import request
 import requests
 
+import json_provider
 import wallet
 
 app = Flask(__name__, template_folder='./templates')
+app.json = json_provider.OrjsonProvider(app)
 
 
 @app.route('/')
@@ -0,0 +1,5 @@
+import os
+
+from wallet_server import app
+
+app.config['gw'] = os.environ.get('BLOCKCHAIN_GW', 'http://127.0.0.1:5000')